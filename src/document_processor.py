@@ -4,14 +4,96 @@ Handles text extraction from PDF, DOCX, and EPUB files.
 """
 import os
 import re
-import uuid
+import functools
+import hashlib
+import mmap
+import tempfile
+import time
+import numpy as np
 import chromadb
 from chromadb.config import Settings
-from chromadb.utils import embedding_functions
+from chromadb.errors import NotFoundError
+
+from embeddings import detect_device, make_embedding_fn
+
+# Vector indexes persist here between runs, one collection per document content hash
+CHROMA_DIR = os.path.join(tempfile.gettempdir(), "echovision_chroma")
+
+# Most persisted indexes kept in CHROMA_DIR; the least recently used go first
+MAX_STORED_INDEXES = 8
+# Seconds between refreshes of an open index's "used" stamp while it is being queried
+INDEX_TOUCH_SECONDS = 60
+
+# Bump whenever chunking changes so indexes built by older code are not reused
+INDEX_VERSION = 4
+
+# Chunks sent to Chroma per add() call; keeps each insert transaction small
+BATCH = 166
+
+# Vector chunks are sized to MiniLM's 256-token window, minus [CLS]/[SEP] and slack;
+# text past the window is truncated by the tokenizer and never embedded
+CHUNK_TOKENS = 240
+TOKENS_PER_WORD = 1.3      # WordPiece average for English prose
+CHARS_PER_TOKEN = 4        # long words split into subwords of about this size
+MIN_CHUNK_CHARS = 200
+MAX_CHUNK_CHARS = 1200
+
+# TXT files are split into sections of about this many bytes, cut at whitespace
+TXT_CHUNK_BYTES = 3600
+
+_SPACE_RE = re.compile(rb"\s")
+
+# Words borrowed from each neighbouring chunk when a hit is returned as context
+CONTEXT_OVERLAP_WORDS = 50
+
+
+def _char_chunks(text: str, size: int):
+    """Yield (offset, chunk) pieces of at most size chars, cut at whitespace where possible."""
+    n = len(text)
+    i = 0
+    while i < n:
+        end = min(i + size, n)
+        if end < n:
+            cut = max(text.rfind(" ", i + 1, end), text.rfind("\n", i + 1, end))
+            if cut > i:
+                end = cut
+        chunk = text[i:end].strip()
+        if chunk:
+            yield i, chunk
+        if end >= n:
+            break
+        i = end
+
+
+def _adaptive_chunk_chars(text: str) -> int:
+    """Chars of this page that fit in CHUNK_TOKENS, estimated in one byte scan."""
+    arr = np.frombuffer(text.encode("utf-8"), dtype=np.uint8)
+    if not arr.size:
+        return MAX_CHUNK_CHARS
+    ws = (arr == 0x20) | (arr == 0x0A) | (arr == 0x09) | (arr == 0x0D)
+    # Count word starts rather than whitespace bytes, so indentation isn't words
+    words = np.count_nonzero(~ws[1:] & ws[:-1]) + (not ws[0])
+    # Multi-byte characters (e.g. CJK) are roughly a token each; UTF-8 lead bytes
+    # are >= 0xC0 while continuation bytes are 0x80-0xBF
+    wide_chars = np.count_nonzero(arr >= 0xC0)
+    ascii_chars = np.count_nonzero((arr < 0x80) & ~ws)
+    tokens = max(words * TOKENS_PER_WORD, ascii_chars / CHARS_PER_TOKEN) + wide_chars
+    size = int(len(text) * CHUNK_TOKENS / max(tokens, 1))
+    return min(MAX_CHUNK_CHARS, max(MIN_CHUNK_CHARS, size))
+
+
+def _pdf_page_text(page) -> str:
+    # "blocks" yields (x0, y0, x1, y1, text, block_no, block_type); type 0 is text
+    blocks = page.get_text("blocks")
+    return "\n".join(b[4] for b in blocks if b[6] == 0).strip()
+
 
 class DocumentProcessor:
     def __init__(self):
-        self.pages = []          # list of {"index": int, "text": str, "label": str, "file_id": int}
+        # Pages are stored as parallel lists; a page's index is its list position
+        self._texts = []         # page text
+        self._labels = []        # page label, e.g. "Page 3" or a chapter heading
+        self._file_ids = []      # id of the loaded file each page came from
         self.loaded_files = []   # list of {"id": int, "path": str, "name": str, "type": str, "page_count": int}
         self.next_file_id = 1
         
@@ -19,13 +101,27 @@ class DocumentProcessor:
         self.file_path = None
         self.doc_type = None
         self.title = "Untitled Document"
+        # search() index, built on demand: all pages lowercased and UTF-8 encoded into
+        # one "\n"-separated buffer, plus each page's [start, end) byte offsets in it
+        self._flat = None
+        self._page_starts = None
+        self._page_ends = None
+        self._full_text_cache: dict[int, str] = {}  # max_chars -> get_full_text() result
         
-        # ChromaDB setup
-        self.chroma_client = chromadb.Client(Settings(anonymized_telemetry=False))
-        # Use simple built-in default embeddings (all-MiniLM-L6-v2) for speed
-        self.embedding_fn = embedding_functions.DefaultEmbeddingFunction()
+        # ChromaDB setup; the client and embedding model are created on first use
+        self.chroma_client = None
+        self.device = None
+        self.embedding_fn = None
         self.collection_name = "doc_collection"
         self.collection = None
+        self._chunk_count = 0  # chunks in self.collection, recorded at index time
+        self._own_collections = set()  # collections this instance built for the current file set
+        self._touched_at = 0.0  # when self.collection's "used" stamp was last refreshed
+        # Per-instance LRU so repeated or retried questions skip the embedding model
+        self._embed_query = functools.lru_cache(maxsize=128)(self._compute_query_embedding)
+        # Whole answers of get_relevant_context, keyed on (query, k, doc hash)
+        self._doc_hash = None
+        self._context_cache = functools.lru_cache(maxsize=256)(self._query_context)
 
     # ─────────────────────────── Public API ───────────────────────────
 
@@ -35,7 +131,10 @@ class DocumentProcessor:
         new_title = os.path.basename(filepath)
         
         if not append:
-            self.pages = []
+            # The previous document's index stays in the store for a later reopen;
+            # from here on only the LRU cap may evict it
+            self._own_collections.clear()
+            self._clear_pages()
             self.loaded_files = []
             self.current_page = 0
             self.file_path = filepath
@@ -49,7 +148,8 @@ class DocumentProcessor:
 
         current_file_id = self.next_file_id
         self.next_file_id += 1
-        start_pages_len = len(self.pages)
+        start_pages_len = len(self._texts)
+        self._invalidate_caches()
 
         try:
             if ext == ".pdf":
@@ -68,7 +168,7 @@ class DocumentProcessor:
                 return False
                 
             # Record file metadata
-            pages_added = len(self.pages) - start_pages_len
+            pages_added = len(self._texts) - start_pages_len
             self.loaded_files.append({
                 "id": current_file_id,
                 "path": filepath,
@@ -77,7 +177,7 @@ class DocumentProcessor:
                 "page_count": pages_added
             })
                 
-            if len(self.pages) > 0:
+            if len(self._texts) > 0:
                 self._build_vector_index()
                 return True
             return False
@@ -95,14 +195,19 @@ class DocumentProcessor:
                         try: os.remove(path)
                         except Exception as e: print(f"Could not delete {path}: {e}")
 
-            if self.collection:
-                try:
-                    self.chroma_client.delete_collection(name=self.collection_name)
-                    self.collection = None
-                except Exception:
-                    pass
+            # Keep the persisted index for a later session unless the files are gone;
+            # a kept index is handed over to the store's LRU eviction
+            if delete_file:
+                self._drop_collections(list(self._own_collections))
+            else:
+                self._own_collections.clear()
+            self.collection = None
+            self._chunk_count = 0
+            self._doc_hash = None
+            self._context_cache.cache_clear()
 
-            self.pages = []
+            self._clear_pages()
+            self._invalidate_caches()
             self.loaded_files = []
             self.current_page = 0
             self.file_path = None
@@ -131,15 +236,15 @@ class DocumentProcessor:
         self.loaded_files = [f for f in self.loaded_files if f["id"] != file_id]
         
         # Filter pages
-        self.pages = [p for p in self.pages if p.get("file_id") != file_id]
+        keep = [i for i, fid in enumerate(self._file_ids) if fid != file_id]
+        self._texts = [self._texts[i] for i in keep]
+        self._labels = [self._labels[i] for i in keep]
+        self._file_ids = [self._file_ids[i] for i in keep]
+        self._invalidate_caches()
         
         # Reset current page if out of bounds
-        if self.current_page >= len(self.pages):
-            self.current_page = max(0, len(self.pages) - 1)
-            
-        # Re-index remaining pages
-        for i, p in enumerate(self.pages):
-            p["index"] = i
+        if self.current_page >= len(self._texts):
+            self.current_page = max(0, len(self._texts) - 1)
 
         # Rebuild title
         if len(self.loaded_files) == 1:
@@ -149,28 +254,31 @@ class DocumentProcessor:
             self.title = f"Multiple Files ({len(self.loaded_files)})"
             self.doc_type = "Mixed"
             
-        # Rebuild vector index
+        # Rebuild vector index; the old one still holds the removed file's text
+        replaced = self.collection_name
         self._build_vector_index()
+        if replaced != self.collection_name:
+            self._drop_collections([replaced])
         return True
 
     def page_count(self) -> int:
-        return len(self.pages)
+        return len(self._texts)
 
     def get_page(self, index: int) -> str:
-        if 0 <= index < len(self.pages):
-            return self.pages[index]["text"]
+        if 0 <= index < len(self._texts):
+            return self._texts[index]
         return ""
 
     def get_current_text(self) -> str:
         return self.get_page(self.current_page)
 
     def get_current_label(self) -> str:
-        if 0 <= self.current_page < len(self.pages):
-            return self.pages[self.current_page]["label"]
+        if 0 <= self.current_page < len(self._labels):
+            return self._labels[self.current_page]
         return "Unknown"
 
     def next_page(self) -> bool:
-        if self.current_page < len(self.pages) - 1:
+        if self.current_page < len(self._texts) - 1:
             self.current_page += 1
             return True
         return False
@@ -182,68 +290,215 @@ class DocumentProcessor:
         return False
 
     def go_to_page(self, index: int) -> bool:
-        if 0 <= index < len(self.pages):
+        if 0 <= index < len(self._texts):
             self.current_page = index
             return True
         return False
 
     def get_full_text(self, max_chars: int = 50000) -> str:
         """Return combined text of all pages (truncated for AI)."""
-        combined = "\n\n".join(p["text"] for p in self.pages)
-        return combined[:max_chars]
+        cached = self._full_text_cache.get(max_chars)
+        if cached is not None:
+            return cached
+        # Only join as many pages as can survive the cut
+        parts = []
+        n = -2  # running length of the joined string; the first page has no separator
+        for text in self._texts:
+            parts.append(text)
+            n += len(text) + 2
+            if n >= max_chars:
+                break
+        combined = "\n\n".join(parts)[:max_chars]
+        self._full_text_cache[max_chars] = combined
+        return combined
 
     def get_chapter_text(self, chapter_num: int) -> str:
         """Return text of a specific chapter/page (1-indexed)."""
         idx = chapter_num - 1
-        if 0 <= idx < len(self.pages):
-            return self.pages[idx]["text"]
+        if 0 <= idx < len(self._texts):
+            return self._texts[idx]
         return ""
 
     def search(self, query: str) -> list:
         """Search text and return list of (page_index, snippet) matches."""
         results = []
-        q = query.lower()
-        for page in self.pages:
-            text = page["text"].lower()
-            pos = text.find(q)
-            if pos != -1:
-                snippet = page["text"][max(0, pos-60):pos+120]
-                results.append({"page": page["index"], "label": page["label"], "snippet": snippet})
+        if not self._texts:
+            return results
+        if self._flat is None:
+            self._build_search_index()
+        q = query.lower().encode("utf-8")
+        # One C-level scan over the whole corpus; after a hit, resume at the next page
+        pos = self._flat.find(q)
+        while pos != -1:
+            i = int(np.searchsorted(self._page_starts, pos, side="right")) - 1
+            start, end = int(self._page_starts[i]), int(self._page_ends[i])
+            if pos + len(q) > end:
+                # Match runs across a page separator
+                pos = self._flat.find(q, pos + 1)
+                continue
+            char_pos = len(self._flat[start:pos].decode("utf-8", errors="ignore"))
+            snippet = self._texts[i][max(0, char_pos-60):char_pos+120]
+            results.append({"page": i, "label": self._labels[i], "snippet": snippet})
+            pos = self._flat.find(q, end + 1)
         return results
 
     def get_relevant_context(self, query: str, n_results: int = 4) -> str:
         """Fetch the most relevant text chunks for a given query via ChromaDB."""
-        if not self.collection or self.collection.count() == 0:
+        try:
+            return self._cached_context(query, n_results)
+        except NotFoundError:
+            # Deleted by another processor sharing the store, or evicted by another
+            # process's LRU cap; rebuild it instead of falling back on every query
+            print("[DocumentProcessor] Vector index missing from ChromaDB; rebuilding.")
+            self._build_vector_index()
+            try:
+                return self._cached_context(query, n_results)
+            except Exception as e:
+                print(f"[DocumentProcessor] Vector search failed: {e}. Falling back to full text.")
+        except Exception as e:
+            print(f"[DocumentProcessor] Vector search failed: {e}. Falling back to full text.")
+        return self.get_full_text(max_chars=10000)
+
+    # ─────────────────────────── Private loaders ───────────────────────
+
+    def _cached_context(self, query: str, n_results: int) -> str:
+        """get_relevant_context through the LRU cache. Chroma errors propagate."""
+        if not self.collection or self._chunk_count == 0:
             return self.get_full_text(max_chars=10000)
 
         # Ensure we don't ask for more results than we have chunks
-        k = min(n_results, self.collection.count())
+        k = min(n_results, self._chunk_count)
         if k == 0:
             return ""
+
+        self._touch_collection()
+        context = self._context_cache(query, k, self._doc_hash)
+        if context is None:
+            return self.get_full_text(max_chars=10000)
+        return context
+
+    def _touch_collection(self):
+        """Refresh the open index's "used" stamp so LRU eviction elsewhere passes it over."""
+        now = time.time()
+        if now - self._touched_at >= INDEX_TOUCH_SECONDS:
+            self.collection.modify(metadata={"complete": True, "used": now})
+            self._touched_at = now
+
+    def _query_context(self, query: str, k: int, doc_hash: str):
+        """Uncached body of get_relevant_context; doc_hash only keys the LRU cache.
+
+        Returns None when the search comes back empty. Errors propagate so they
+        are never cached.
+        """
+        emb = self._embed_query(query)
+        results = self.collection.query(
+            query_embeddings=[emb],
+            n_results=k
+        )
+        
+        if not results["documents"] or not results["documents"][0]:
+            return None
             
-        try:
-            results = self.collection.query(
-                query_texts=[query],
-                n_results=k
+        # Combine the returned chunks, padded with their neighbours' edges
+        documents = self._with_neighbours(results["documents"][0], results["metadatas"][0])
+        return "\n...\n".join(documents)
+
+    def _ensure_chroma(self):
+        if self.chroma_client is None:
+            os.makedirs(CHROMA_DIR, exist_ok=True)
+            self.chroma_client = chromadb.PersistentClient(
+                path=CHROMA_DIR, settings=Settings(anonymized_telemetry=False)
             )
-            
-            if not results["documents"] or not results["documents"][0]:
-                return self.get_full_text(max_chars=10000)
-                
-            # Combine the returned chunks
-            documents = results["documents"][0]
-            context = "\n...\n".join(documents)
-            return context
-        except Exception as e:
-            print(f"[DocumentProcessor] Vector search failed: {e}. Falling back to full text.")
-            return self.get_full_text(max_chars=10000)
-
-    # ─────────────────────────── Private loaders ───────────────────────
+            # all-MiniLM-L6-v2 (Chroma's default model): sentence-transformers on a GPU
+            # when one is available, otherwise int8 ONNX on the CPU
+            self.device = detect_device()
+            self.embedding_fn = make_embedding_fn(self.device)
+
+    def _compute_doc_hash(self) -> str:
+        """Hash of the loaded pages plus everything that shapes their index."""
+        h = hashlib.blake2b(digest_size=8)
+        h.update(f"{INDEX_VERSION}:{type(self.embedding_fn).__name__}".encode())
+        for text in self._texts:
+            h.update(text.encode("utf-8", errors="ignore"))
+            h.update(b"\0")
+        return h.hexdigest()
+
+    def _compute_query_embedding(self, query: str) -> np.ndarray:
+        emb = np.asarray(self.embedding_fn([query])[0], dtype=np.float32)
+        emb.setflags(write=False)  # shared by every cache hit
+        return emb
+
+    def _add_page(self, text: str, label: str, file_id: int):
+        self._texts.append(text)
+        self._labels.append(label)
+        self._file_ids.append(file_id)
+
+    def _build_search_index(self):
+        encoded = [t.lower().encode("utf-8") for t in self._texts]
+        lengths = np.fromiter((len(b) for b in encoded), dtype=np.int64, count=len(encoded))
+        self._page_starts = np.concatenate(([0], np.cumsum(lengths + 1)[:-1]))
+        self._page_ends = self._page_starts + lengths
+        self._flat = b"\n".join(encoded)
+
+    def _invalidate_caches(self):
+        """Drop everything derived from the page lists; call whenever they change."""
+        self._flat = None
+        self._page_starts = None
+        self._page_ends = None
+        self._full_text_cache.clear()
+
+    def _clear_pages(self):
+        self._texts = []
+        self._labels = []
+        self._file_ids = []
+
+    def _with_neighbours(self, documents: list, metadatas: list) -> list:
+        """Extend each hit with the edges of the chunks either side of it on the same page."""
+        chunks = {m["chunk"]: (m["page"], d) for d, m in zip(documents, metadatas)}
+        missing = sorted({m["chunk"] + d for m in metadatas for d in (-1, 1)} - chunks.keys())
+        if missing:
+            got = self.collection.get(
+                where={"chunk": {"$in": missing}},
+                include=["documents", "metadatas"]
+            )
+            for d, m in zip(got["documents"], got["metadatas"]):
+                chunks[m["chunk"]] = (m["page"], d)
+
+        padded = []
+        for doc, meta in zip(documents, metadatas):
+            prev = chunks.get(meta["chunk"] - 1)
+            nxt = chunks.get(meta["chunk"] + 1)
+            head = " ".join(prev[1].split()[-CONTEXT_OVERLAP_WORDS:]) if prev and prev[0] == meta["page"] else ""
+            tail = " ".join(nxt[1].split()[:CONTEXT_OVERLAP_WORDS]) if nxt and nxt[0] == meta["page"] else ""
+            padded.append(" ".join(part for part in (head, doc, tail) if part))
+        return padded
 
     def _build_vector_index(self):
-        """Index all loaded pages into an ephemeral Chroma collection."""
+        """Index all loaded pages into a persistent Chroma collection keyed on their content."""
+        self._chunk_count = 0
         try:
-            # Recreate collection to clear old data
+            self._ensure_chroma()
+            self._doc_hash = self._compute_doc_hash()
+            self.collection_name = f"doc_{self._doc_hash}"
+
+            # The same content may already have been indexed by an earlier session
+            try:
+                existing = self.chroma_client.get_collection(
+                    name=self.collection_name,
+                    embedding_function=self.embedding_fn
+                )
+                if (existing.metadata or {}).get("complete"):
+                    self.collection = existing
+                    self._chunk_count = existing.count()
+                    self._touched_at = time.time()
+                    self.collection.modify(metadata={"complete": True, "used": self._touched_at})
+                    print(f"[DocumentProcessor] Reusing {self._chunk_count} indexed chunks from ChromaDB.")
+                    self._evict_old_indexes()
+                    return
+            except Exception:
+                pass
+
+            # Recreate collection to clear old or partially written data
             try:
                 self.chroma_client.delete_collection(name=self.collection_name)
             except Exception:
@@ -253,57 +508,91 @@ class DocumentProcessor:
                 name=self.collection_name, 
                 embedding_function=self.embedding_fn
             )
+            self._own_collections.add(self.collection_name)
             
             # Simple chunking logic to ensure we don't hit max payload sizes
             docs = []
             metadatas = []
             ids = []
             
-            for page in self.pages:
-                text = page["text"]
-                # Chunk aggressively for better vector retrieval
-                words = text.split()
-                chunk_size = 300
-                overlap = 50
-                
-                if not words: continue
+            for page_no, text in enumerate(self._texts):
+                # Chunk to fit the embedding model's token window.
+                # Chunks don't overlap; neighbouring context is added back at query time
+                chunk_size = _adaptive_chunk_chars(text)
                 
-                for i in range(0, len(words), chunk_size - overlap):
-                    chunk = " ".join(words[i:i + chunk_size])
+                for i, chunk in _char_chunks(text, chunk_size):
                     docs.append(chunk)
-                    metadatas.append({"page": page["index"], "label": page["label"]})
-                    ids.append(str(uuid.uuid4()))
+                    metadatas.append({"page": page_no, "label": self._labels[page_no], "chunk": len(docs) - 1})
+                    ids.append(f"p{page_no}_c{i}")
                     
             if docs:
-                self.collection.add(
-                    documents=docs,
-                    metadatas=metadatas,
-                    ids=ids
-                )
+                # Embed everything in one batched call, then insert in BATCH-sized slices
+                # of a single float32 matrix (no per-float Python objects)
+                embeddings = self.embedding_fn.encode_batch(docs)
+                for i in range(0, len(docs), BATCH):
+                    self._flush(
+                        docs[i:i + BATCH],
+                        embeddings[i:i + BATCH],
+                        metadatas[i:i + BATCH],
+                        ids[i:i + BATCH]
+                    )
+                self._chunk_count = len(docs)
+                # Only a fully written collection is eligible for reuse
+                self._touched_at = time.time()
+                self.collection.modify(metadata={"complete": True, "used": self._touched_at})
                 print(f"[DocumentProcessor] Indexed {len(docs)} chunks into ChromaDB.")
+            self._evict_old_indexes()
         except Exception as e:
             print(f"[DocumentProcessor] Error bulding vector index: {e}")
             self.collection = None
+            self._chunk_count = 0
+
+    def _drop_collections(self, names):
+        """Delete those of names this instance built; reused ones are left to the LRU cap."""
+        for name in names:
+            if name not in self._own_collections:
+                continue
+            try:
+                self.chroma_client.delete_collection(name=name)
+            except Exception:
+                pass
+            self._own_collections.discard(name)
+
+    def _evict_old_indexes(self):
+        """Cap the shared store at MAX_STORED_INDEXES, dropping the least recently used."""
+        try:
+            others = [c for c in self.chroma_client.list_collections()
+                      if c.name.startswith("doc_") and c.name != self.collection_name]
+            others.sort(key=lambda c: (c.metadata or {}).get("used", 0))
+            for c in others[:max(0, len(others) + 1 - MAX_STORED_INDEXES)]:
+                self.chroma_client.delete_collection(name=c.name)
+        except Exception as e:
+            print(f"[DocumentProcessor] Could not evict old indexes: {e}")
+
+    def _flush(self, docs: list, embeddings: np.ndarray, metadatas: list, ids: list):
+        """Add one batch of pre-embedded chunks to the collection."""
+        self.collection.add(
+            documents=docs,
+            embeddings=embeddings,
+            metadatas=metadatas,
+            ids=ids
+        )
 
     def _load_pdf(self, filepath: str, file_id: int):
         import fitz  # PyMuPDF
-        start_idx = len(self.pages)
+        start_idx = len(self._texts)
         doc = fitz.open(filepath)
-        for i, page in enumerate(doc):
-            text = page.get_text("text").strip()
-            if text:
-                self.pages.append({
-                    "index": start_idx + i,
-                    "text": text,
-                    "label": f"Page {start_idx + i + 1}",
-                    "file_id": file_id
-                })
+        texts = [_pdf_page_text(page) for page in doc]
         doc.close()
 
+        for i, text in enumerate(texts):
+            if text:
+                self._add_page(text, f"Page {start_idx + i + 1}", file_id)
+
     def _load_docx(self, filepath: str, file_id: int):
         from docx import Document
         doc = Document(filepath)
-        start_idx = len(self.pages)
+        start_idx = len(self._texts)
         # Split by headings into chapters, otherwise into chunks
         current_chunk = []
         chapter_idx = start_idx
@@ -312,12 +601,7 @@ class DocumentProcessor:
         for para in doc.paragraphs:
             if para.style.name.startswith("Heading"):
                 if current_chunk:
-                    self.pages.append({
-                        "index": chapter_idx,
-                        "text": "\n".join(current_chunk),
-                        "label": chapter_label,
-                        "file_id": file_id
-                    })
+                    self._add_page("\n".join(current_chunk), chapter_label, file_id)
                     chapter_idx += 1
                 chapter_label = para.text.strip() or f"Section {chapter_idx + 1}"
                 current_chunk = []
@@ -326,61 +610,57 @@ class DocumentProcessor:
                     current_chunk.append(para.text.strip())
 
         if current_chunk:
-            self.pages.append({
-                "index": chapter_idx,
-                "text": "\n".join(current_chunk),
-                "label": chapter_label,
-                "file_id": file_id
-            })
+            self._add_page("\n".join(current_chunk), chapter_label, file_id)
 
         # If no headings found, chunk by ~500 words
-        if not self.pages or all(p.get("file_id") != file_id for p in self.pages):
+        if file_id not in self._file_ids:
             all_text = "\n".join(p.text for p in doc.paragraphs if p.text.strip())
-            words = all_text.split()
-            chunk_size = 500
-            for i in range(0, len(words), chunk_size):
-                chunk = " ".join(words[i:i + chunk_size])
-                self.pages.append({
-                    "index": start_idx + (i // chunk_size),
-                    "text": chunk,
-                    "label": f"Section {start_idx + (i // chunk_size) + 1}",
-                    "file_id": file_id
-                })
+            for n, (_, chunk) in enumerate(_char_chunks(all_text, 3000)):
+                self._add_page(chunk, f"Section {start_idx + n + 1}", file_id)
 
     def _load_epub(self, filepath: str, file_id: int):
         import ebooklib
         from ebooklib import epub
-        from bs4 import BeautifulSoup
+        from lxml import etree, html as lhtml
 
         book = epub.read_epub(filepath)
-        start_idx = len(self.pages)
+        start_idx = len(self._texts)
         chapter_idx = start_idx
         for item in book.get_items():
             if item.get_type() == ebooklib.ITEM_DOCUMENT:
-                soup = BeautifulSoup(item.get_content(), "html.parser")
-                text = soup.get_text(separator="\n").strip()
+                try:
+                    root = lhtml.fromstring(item.get_content())
+                except etree.ParserError:
+                    continue  # empty or whitespace-only item
+                # Stylesheets and scripts are not part of the readable text
+                etree.strip_elements(root, "script", "style", with_tail=False)
+                # Skip whitespace-only nodes (markup indentation) so they don't pad the text
+                text = "\n".join(t for t in root.itertext() if not t.isspace()).strip()
                 if len(text) > 100:
-                    title_tag = soup.find(["h1", "h2", "h3"])
-                    label = title_tag.get_text().strip() if title_tag else f"Chapter {chapter_idx + 1}"
-                    self.pages.append({
-                        "index": chapter_idx,
-                        "text": text,
-                        "label": label,
-                        "file_id": file_id
-                    })
+                    title_tag = root.xpath("(//h1|//h2|//h3)[1]")
+                    label = title_tag[0].text_content().strip() if title_tag else f"Chapter {chapter_idx + 1}"
+                    self._add_page(text, label, file_id)
                     chapter_idx += 1
 
     def _load_txt(self, filepath: str, file_id: int):
-        with open(filepath, "r", encoding="utf-8", errors="ignore") as f:
-            content = f.read()
-        words = content.split()
-        chunk_size = 600
-        start_idx = len(self.pages)
-        for i in range(0, len(words), chunk_size):
-            chunk = " ".join(words[i:i + chunk_size])
-            self.pages.append({
-                "index": start_idx + (i // chunk_size),
-                "text": chunk,
-                "label": f"Section {start_idx + (i // chunk_size) + 1}",
-                "file_id": file_id
-            })
+        start_idx = len(self._texts)
+        with open(filepath, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return
+            # Walk the mapped file in byte ranges; only one section is decoded at a time
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                size = len(mm)
+                off = 0
+                n = 0
+                while off < size:
+                    end = off + TXT_CHUNK_BYTES
+                    if end < size:
+                        m = _SPACE_RE.search(mm, end)
+                        end = m.start() if m else size
+                    else:
+                        end = size
+                    chunk = mm[off:end].decode("utf-8", errors="ignore").strip()
+                    off = end
+                    if chunk:
+                        self._add_page(chunk, f"Section {start_idx + n + 1}", file_id)
+                        n += 1
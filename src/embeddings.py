@@ -0,0 +1,105 @@
+"""
+embeddings.py
+Embedding functions used to index document chunks in ChromaDB.
+"""
+import os
+from functools import cached_property
+
+import numpy as np
+
+from chromadb.utils.embedding_functions import (
+    ONNXMiniLM_L6_V2,
+    SentenceTransformerEmbeddingFunction,
+)
+
+MODEL_NAME = "all-MiniLM-L6-v2"
+
+
+def detect_device() -> str:
+    """Return "cuda" when PyTorch can see a GPU, otherwise "cpu"."""
+    try:
+        import torch
+        return "cuda" if torch.cuda.is_available() else "cpu"
+    except Exception:
+        return "cpu"
+
+
+def make_embedding_fn(device: str):
+    """Pick the fastest MiniLM embedder for the given device."""
+    if device == "cuda":
+        try:
+            return GPUMiniLM(device=device)
+        except Exception as e:
+            print(f"[Embeddings] GPU embedder unavailable ({e}); using ONNX on CPU.")
+    return QuantizedMiniLM()
+
+
+class QuantizedMiniLM(ONNXMiniLM_L6_V2):
+    """all-MiniLM-L6-v2 on ONNX Runtime with int8 dynamically quantized weights.
+
+    Reuses Chroma's downloaded model and tokenizer; the quantized copy is written
+    next to the original on first use.
+    """
+    QUANT_FILENAME = "model_quant.onnx"
+
+    def _quantized_model_path(self) -> str:
+        folder = os.path.join(self.DOWNLOAD_PATH, self.EXTRACTED_FOLDER_NAME)
+        fp32_path = os.path.join(folder, "model.onnx")
+        quant_path = os.path.join(folder, self.QUANT_FILENAME)
+        if os.path.exists(quant_path):
+            return quant_path
+
+        self._download_model_if_not_exists()
+        try:
+            from onnxruntime.quantization import quantize_dynamic, QuantType
+            tmp_path = quant_path + ".tmp"
+            quantize_dynamic(fp32_path, tmp_path, weight_type=QuantType.QInt8)
+            os.replace(tmp_path, quant_path)
+            return quant_path
+        except Exception as e:
+            print(f"[Embeddings] int8 quantization unavailable ({e}); using FP32 model.")
+            return fp32_path
+
+    @cached_property
+    def model(self):
+        so = self.ort.SessionOptions()
+        so.log_severity_level = 3
+        so.graph_optimization_level = self.ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        return self.ort.InferenceSession(
+            self._quantized_model_path(),
+            providers=["CPUExecutionProvider"],
+            sess_options=so
+        )
+
+    def encode_batch(self, documents) -> np.ndarray:
+        """Embed documents into one (n, 384) float32 matrix.
+
+        Chroma's EmbeddingFunction wrapper splits whatever __call__ returns into a
+        list of rows, so bulk indexing calls this directly.
+        """
+        self._download_model_if_not_exists()
+        return np.ascontiguousarray(self._forward(list(documents)), dtype=np.float32)
+
+    def __call__(self, input):
+        return self.encode_batch(input)
+
+
+class GPUMiniLM(SentenceTransformerEmbeddingFunction):
+    """all-MiniLM-L6-v2 through sentence-transformers, batched on the GPU."""
+    BATCH_SIZE = 64
+
+    def __init__(self, device: str = "cuda"):
+        super().__init__(model_name=MODEL_NAME, device=device, normalize_embeddings=True)
+
+    def encode_batch(self, documents) -> np.ndarray:
+        """Embed documents into one (n, 384) float32 matrix, bypassing Chroma's wrapper."""
+        embeddings = self._model.encode(
+            list(documents),
+            batch_size=self.BATCH_SIZE,
+            convert_to_numpy=True,
+            normalize_embeddings=self.normalize_embeddings,
+        )
+        return np.ascontiguousarray(embeddings, dtype=np.float32)
+
+    def __call__(self, input):
+        return self.encode_batch(input)
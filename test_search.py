@@ -0,0 +1,69 @@
+import sys
+import os
+import tempfile
+
+# Ensure src in path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src'))
+from document_processor import DocumentProcessor, TXT_CHUNK_BYTES
+
+def make_processor(texts):
+    dp = DocumentProcessor()
+    for i, text in enumerate(texts):
+        dp._add_page(text, f"Page {i + 1}", 1)
+    return dp
+
+def test_search():
+    dp = make_processor([
+        "The quick brown fox",
+        "",                               # empty page
+        "jumps over the lazy dog",
+        "Café crème — naïve façade",      # non-ASCII
+        "fox again at the end",
+    ])
+
+    print("--- Test 1. One hit per page, pages after an empty one ---")
+    hits = dp.search("FOX")
+    print(hits)
+    assert [h["page"] for h in hits] == [0, 4]
+    assert hits[1]["label"] == "Page 5"
+
+    print("--- Test 2. Match across a page boundary is ignored ---")
+    # "fox" ends page 0 and "jumps" starts page 2; the flat buffer joins them with "\n"
+    assert dp.search("fox\n") == []
+    assert dp.search("fox\njumps") == []
+
+    print("--- Test 3. Non-ASCII snippet offsets ---")
+    hits = dp.search("NAÏVE")
+    print(hits)
+    assert [h["page"] for h in hits] == [3]
+    assert hits[0]["snippet"].startswith("Café crème — naïve")
+    hits = dp.search("façade")
+    assert hits[0]["snippet"] == "Café crème — naïve façade"
+
+    print("--- Test 4. Empty query matches every page once ---")
+    assert [h["page"] for h in dp.search("")] == [0, 1, 2, 3, 4]
+
+    print("--- Test 5. No pages ---")
+    assert make_processor([]).search("fox") == []
+
+def test_txt_sections():
+    words = [f"wörd{i}" for i in range(3000)]
+    with tempfile.NamedTemporaryFile("w", suffix=".txt", encoding="utf-8", delete=False) as f:
+        f.write("\n".join(words))
+        path = f.name
+    try:
+        dp = DocumentProcessor()
+        dp._load_txt(path, 1)
+        print(f"--- Test 6. TXT split into {dp.page_count()} sections ---")
+        assert dp.page_count() > 1
+        # Sections are cut at whitespace: no word is split or lost
+        assert [w for t in dp._texts for w in t.split()] == words
+        assert all(len(t.encode("utf-8")) <= TXT_CHUNK_BYTES + 16 for t in dp._texts)
+        assert dp.get_current_label() == "Section 1"
+    finally:
+        os.remove(path)
+
+if __name__ == '__main__':
+    test_search()
+    test_txt_sections()
+    print("All search checks passed.")